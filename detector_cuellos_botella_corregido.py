@@ -14,15 +14,227 @@ VERSIÓN CORREGIDA:
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import linalg
-import seaborn as sns
+from scipy.linalg.lapack import dgees
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
 import json
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el módulo json estándar
+    orjson = None
+
+# Con BATCH=1 los gráficos se generan sin ventana (backend Agg) para corridas en lote
+MODO_BATCH = os.environ.get('BATCH') == '1'
+if MODO_BATCH:
+    import matplotlib
+    matplotlib.use('Agg')
+
+# Cantidad de escenarios de flujo distintos que se recuerdan
+TAMANO_CACHE = 64
+
+# Orden de los flujos cuando se manejan como arreglo
+CLAVES_FLUJO = ('A_to_H', 'H_to_E', 'H_to_R', 'E_to_V', 'E_to_R', 'R_to_H', 'R_to_D')
+
+# Lectura de varias claves de datos_flujo en una sola llamada
+_leer_flujos = itemgetter(*CLAVES_FLUJO)
+_leer_totales = itemgetter('A_to_H', 'E_to_V', 'H_to_R', 'E_to_R', 'R_to_D')
+
+# Posiciones (fila, columna) no nulas de la matriz de transición:
+# A→H, H→E, H→R, E→V, E→R, R→H, R→D, V→V, D→D
+TRANSICIONES = (np.array([0, 1, 1, 2, 2, 3, 3, 4, 5]),
+                np.array([1, 2, 3, 4, 3, 1, 5, 4, 5]))
+
+# Las filas de TRANSICIONES ya están ordenadas, así que el mismo patrón sirve
+# como CSR: columnas TRANSICIONES[1] y cada fila i en [INDPTR[i], INDPTR[i+1])
+INDPTR_TRANSICIONES = np.array([0, 1, 3, 5, 7, 8, 9])
+
+
+def _iteracion_potencia(data, indices, indptr, v, tol=1e-12, max_iter=500):
+    """
+    Itera v ← P·v hasta que el cambio sea menor que tol, con P en formato CSR
+    (data, indices, indptr) para recorrer solo las transiciones no nulas.
+    Devuelve el vector alcanzado y si la iteración convergió.
+    """
+    n = len(indptr) - 1
+    for _ in range(max_iter):
+        nuevo = np.zeros(n)
+        for i in range(n):
+            suma = 0.0
+            for k in range(indptr[i], indptr[i + 1]):
+                suma += data[k] * v[indices[k]]
+            nuevo[i] = suma
+        cambio = np.max(np.abs(nuevo - v))
+        v = nuevo
+        if cambio < tol:
+            return v, True
+    return v, False
+
+
+@lru_cache(maxsize=None)
+def _kernel_potencia():
+    """
+    Compila _iteracion_potencia con Numba la primera vez que se necesita:
+    importar numba tarda más que el resto del módulo. Numba es opcional;
+    sin él el kernel corre como Python puro.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return _iteracion_potencia
+    return njit(cache=True)(_iteracion_potencia)
+
+
+def _matrices_transicion(flujos):
+    """
+    Construye las matrices de transición de varios escenarios a la vez.
+    flujos es un arreglo (B, 7) en el orden de CLAVES_FLUJO; devuelve (B, 6, 6).
+    """
+    # Flujos de la cadena en el orden de TRANSICIONES: A→H es siempre 100%
+    # y los estados absorbentes (según el informe) se quedan en sí mismos
+    valores = np.ones((len(flujos), len(TRANSICIONES[0])))
+    valores[:, 1:7] = flujos[:, 1:]
+    matrices = np.zeros((len(flujos), 6, 6), dtype=float)
+    matrices[:, TRANSICIONES[0], TRANSICIONES[1]] = valores
+    
+    # Normalizar cada fila por su total en una sola división; las filas
+    # sin flujo quedan en cero
+    totales = matrices.sum(axis=2, keepdims=True)
+    return np.divide(matrices, totales, out=np.zeros_like(matrices), where=totales > 0)
+
+
+def _resolver_autovectores(matrices):
+    """
+    Resuelve (P - I)·v = 0 para un arreglo (B, 6, 6) de matrices, reemplazando
+    las filas absorbentes (nulas) por v_Venta = 0 y v_Descarte = 1.
+    """
+    n = matrices.shape[-1]
+    A = matrices - np.eye(n)
+    A[:, 4] = np.eye(n)[4]
+    A[:, 5] = np.eye(n)[5]
+    b = np.zeros((len(matrices), n, 1))
+    b[:, 5] = 1.0
+    v = np.linalg.solve(A, b)[..., 0]
+    
+    # Son probabilidades: se recortan los residuos negativos del redondeo y
+    # sumar 0.0 convierte los -0.0 en 0.0
+    return np.clip(v, 0.0, None) + 0.0
+
+
+# La matriz se guarda por flujos (clave: tuple(sorted(datos_flujo.items()))) y
+# sus resultados espectrales por la matriz misma (clave: _clave_matriz(P)), así
+# que también sirven para una matriz asignada o modificada a mano. Los arreglos
+# cacheados son de solo lectura porque se comparten entre llamadas.
+
+def _clave_matriz(P):
+    """Clave de caché de una matriz de transición: su tamaño y sus bytes"""
+    P = np.ascontiguousarray(P, dtype=float)
+    return len(P), P.tobytes()
+
+
+def _matriz_de_clave(clave_matriz):
+    """Reconstruye (en solo lectura) la matriz de una clave de _clave_matriz"""
+    n, datos = clave_matriz
+    return np.frombuffer(datos).reshape(n, n)
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _matriz_transicion(clave_flujos):
+    """Construye la matriz de transición estocástica para unos flujos"""
+    d = dict(clave_flujos)
+    P = _matrices_transicion(np.array([_leer_flujos(d)], dtype=float))[0]
+    P.flags.writeable = False
+    return P
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _autovalores(clave_matriz):
+    """Autovalores reales de la matriz de transición, ordenados por magnitud"""
+    P = _matriz_de_clave(clave_matriz)
+    
+    # La cadena tiene 6 etapas fijas: a ese tamaño la descomposición densa
+    # siempre es más rápida que ARPACK (eigs con k=1)
+    # dgees (forma real de Schur) devuelve por separado la parte real wr de cada
+    # autovalor, así que no se crean arreglos complejos que luego se descartarían;
+    # con compute_v=0 tampoco acumula los vectores de Schur
+    _, _, autovalores, _, _, _, info = dgees(lambda wr, wi: 0, P, compute_v=0)
+    if info != 0:
+        raise np.linalg.LinAlgError("La forma de Schur no convergió")
+    
+    # Ordenar por magnitud (mayor a menor) - importante para encontrar el dominante
+    autovalores = autovalores[np.argsort(np.abs(autovalores))[::-1]]
+    autovalores.flags.writeable = False
+    return autovalores
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _autovector_dominante(clave_matriz):
+    """Autovector dominante (λ = 1) normalizado para que sume 1"""
+    P = _matriz_de_clave(clave_matriz)
+    
+    # El autovalor dominante de una matriz estocástica es 1. Con dos estados
+    # absorbentes su autovector no es único; se fijan v_Venta = 0 y
+    # v_Descarte = 1, de modo que v_i es la probabilidad de terminar en
+    # Descarte partiendo de la etapa i. Iterar v ← P·v desde el vector
+    # indicador de Descarte converge justamente a ese autovector.
+    n = len(P)
+    b = np.zeros(n)
+    b[5] = 1.0
+    if P.shape == (6, 6) and np.count_nonzero(P) == np.count_nonzero(P[TRANSICIONES]):
+        # La cadena de la panadería: su patrón CSR es fijo
+        data, indices, indptr = P[TRANSICIONES], TRANSICIONES[1], INDPTR_TRANSICIONES
+    else:
+        # Una matriz modificada a mano: el patrón se lee de sus valores no nulos
+        filas, indices = np.nonzero(P)
+        data = P[filas, indices]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(filas, minlength=n))))
+    v, convergio = _kernel_potencia()(data, indices, indptr, b)
+    
+    # Si el reproceso es muy cíclico la iteración converge lento: resolver
+    # el sistema lineal directamente
+    if not convergio:
+        v = _resolver_autovectores(P[np.newaxis])[0]
+    
+    # Normalizar el autovector dominante para que sume 1
+    # Esto es crucial para la interpretación correcta
+    v = v / v.sum()
+    v.flags.writeable = False
+    return v
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _autovector_forma_cerrada(clave_flujos):
+    """
+    Autovector dominante de la cadena fija de la panadería sin álgebra lineal.
+    Con v_V = 0 y v_D = 1, el sistema (P - I)·v = 0 se resuelve a mano:
+        v_E = p_ER·v_R,   v_H = c·v_R  con  c = p_HE·p_ER + p_HR,
+        v_R = p_RH·v_H + p_RD  →  v_R = p_RD / (1 - p_RH·c),   v_A = v_H
+    Devuelve None si la cadena no tiene salida (1 - p_RH·c = 0).
+    """
+    _, h_e, h_r, e_v, e_r, r_h, r_d = _leer_flujos(dict(clave_flujos))
+    
+    # Probabilidades de transición (las filas sin flujo quedan en cero)
+    total_h, total_e, total_r = h_e + h_r, e_v + e_r, r_h + r_d
+    p_he, p_hr = (h_e / total_h, h_r / total_h) if total_h > 0 else (0.0, 0.0)
+    p_er = e_r / total_e if total_e > 0 else 0.0
+    p_rh, p_rd = (r_h / total_r, r_d / total_r) if total_r > 0 else (0.0, 0.0)
+    
+    c = p_he * p_er + p_hr
+    denominador = 1.0 - p_rh * c
+    if denominador == 0:
+        return None
+    
+    v_r = p_rd / denominador
+    v_h = c * v_r
+    v = np.array([v_h, v_h, p_er * v_r, v_r, 0.0, 1.0])
+    
+    # Normalizar el autovector dominante para que sume 1
+    v = v / v.sum()
+    v.flags.writeable = False
+    return v
 
-# Configuración de estilo para gráficos
-plt.style.use('seaborn-v0_8')
-sns.set_palette("husl")
 
 class DetectorCuelloBotellaCorregido:
     """
@@ -32,18 +244,46 @@ class DetectorCuelloBotellaCorregido:
     CORRECCIÓN: El cuello de botella se identifica SOLO en etapas productivas
     """
     
-    def __init__(self):
-        self.etapas = ['Amasado', 'Horneado', 'Empaque', 'Reproceso', 'Venta', 'Descarte']
-        self.etapas_abrev = ['A', 'H', 'E', 'R', 'V', 'D']
-        self.etapas_productivas = ['Amasado', 'Horneado', 'Empaque', 'Reproceso']  # Solo estas pueden ser cuellos de botella
+    # Las etapas son constantes: se comparten entre instancias
+    ETAPAS = ('Amasado', 'Horneado', 'Empaque', 'Reproceso', 'Venta', 'Descarte')
+    ETAPAS_ABREV = ('A', 'H', 'E', 'R', 'V', 'D')
+    ETAPAS_PRODUCTIVAS = ('Amasado', 'Horneado', 'Empaque', 'Reproceso')  # Solo estas pueden ser cuellos de botella
+    _MASCARA_PRODUCTIVA = np.array([True, True, True, True, False, False])
+    _MASCARA_PRODUCTIVA.flags.writeable = False
+    
+    # Flujos que se piden al usuario: (clave, descripción, valor de ejemplo del informe)
+    PREGUNTAS_FLUJO = (
+        ('A_to_H', 'Amasado a Horneado', 1000),
+        ('H_to_E', 'Horneado a Empaque', 944),
+        ('H_to_R', 'Horneado a Reproceso', 56),
+        ('E_to_V', 'Empaque a Venta', 921),
+        ('E_to_R', 'Empaque a Reproceso', 23),
+        ('R_to_H', 'Reproceso a Horneado', 59),
+        ('R_to_D', 'Reproceso a Descarte', 20)
+    )
+    
+    # Barras de texto precalculadas para 0-100% (2 caracteres por punto porcentual)
+    _BARRAS = tuple("█" * i for i in range(201))
+    
+    # Atributos por instancia sin __dict__
+    __slots__ = ('matriz_transicion', 'autovalores', 'autovalor_dominante', 'autovector_dominante',
+                 'cuello_botella_idx', 'cuello_botella_nombre', 'datos_flujo', 'forma_cerrada',
+                 '_clave_flujos', '_figura')
+    
+    def __init__(self, forma_cerrada=True):
+        # forma_cerrada=False calcula siempre el autovector de matriz_transicion
+        # con el método genérico; con True la forma cerrada solo se usa cuando la
+        # matriz es la que construir_matriz_transicion() armó desde datos_flujo
+        self.forma_cerrada = forma_cerrada
         self.matriz_transicion = None
         self.autovalores = None
-        self.autovectores = None
         self.autovalor_dominante = None
         self.autovector_dominante = None
         self.cuello_botella_idx = None
         self.cuello_botella_nombre = None
         self.datos_flujo = {}
+        self._clave_flujos = None
+        self._figura = None
         
     def ingresar_datos_flujo(self):
         """
@@ -56,46 +296,14 @@ class DetectorCuelloBotellaCorregido:
         print("(Presione Enter para usar valores de ejemplo de la panadería)\n")
         
         # Valores por defecto (ejemplo de la panadería del informe)
-        valores_default = {
-            'A_to_H': 1000,
-            'H_to_E': 944,
-            'H_to_R': 56,
-            'E_to_V': 921,
-            'E_to_R': 23,
-            'R_to_H': 59,
-            'R_to_D': 20
-        }
+        valores_default = {clave: default for clave, _, default in self.PREGUNTAS_FLUJO}
         
         self.datos_flujo = {}
         
         try:
-            # Amasado → Horneado
-            val = input(f"Productos de Amasado a Horneado [{valores_default['A_to_H']}]: ")
-            self.datos_flujo['A_to_H'] = int(val) if val.strip() else valores_default['A_to_H']
-            
-            # Horneado → Empaque
-            val = input(f"Productos de Horneado a Empaque [{valores_default['H_to_E']}]: ")
-            self.datos_flujo['H_to_E'] = int(val) if val.strip() else valores_default['H_to_E']
-            
-            # Horneado → Reproceso
-            val = input(f"Productos de Horneado a Reproceso [{valores_default['H_to_R']}]: ")
-            self.datos_flujo['H_to_R'] = int(val) if val.strip() else valores_default['H_to_R']
-            
-            # Empaque → Venta
-            val = input(f"Productos de Empaque a Venta [{valores_default['E_to_V']}]: ")
-            self.datos_flujo['E_to_V'] = int(val) if val.strip() else valores_default['E_to_V']
-            
-            # Empaque → Reproceso
-            val = input(f"Productos de Empaque a Reproceso [{valores_default['E_to_R']}]: ")
-            self.datos_flujo['E_to_R'] = int(val) if val.strip() else valores_default['E_to_R']
-            
-            # Reproceso → Horneado
-            val = input(f"Productos de Reproceso a Horneado [{valores_default['R_to_H']}]: ")
-            self.datos_flujo['R_to_H'] = int(val) if val.strip() else valores_default['R_to_H']
-            
-            # Reproceso → Descarte
-            val = input(f"Productos de Reproceso a Descarte [{valores_default['R_to_D']}]: ")
-            self.datos_flujo['R_to_D'] = int(val) if val.strip() else valores_default['R_to_D']
+            for clave, descripcion, default in self.PREGUNTAS_FLUJO:
+                val = input(f"Productos de {descripcion} [{default}]: ").strip()
+                self.datos_flujo[clave] = int(val) if val else default
             
         except ValueError:
             print("Error: Por favor ingrese valores numéricos válidos.")
@@ -104,14 +312,24 @@ class DetectorCuelloBotellaCorregido:
         print(f"\n✓ Datos ingresados correctamente")
         self._mostrar_resumen_flujo()
     
+    def ingresar_datos_flujo_dict(self, datos):
+        """
+        Carga los datos de flujo desde un diccionario, sin entrada ni salida
+        por consola (modo batch). Las claves faltantes usan el valor de ejemplo.
+        """
+        self.datos_flujo = self._completar_flujos(datos)
+    
+    @classmethod
+    def _completar_flujos(cls, datos):
+        """Flujos de un diccionario como enteros; las claves faltantes usan el valor de ejemplo"""
+        return {clave: int(datos.get(clave, default)) for clave, _, default in cls.PREGUNTAS_FLUJO}
+    
     def _mostrar_resumen_flujo(self):
         """Muestra un resumen de los datos de flujo ingresados"""
         print("\n📊 RESUMEN DEL FLUJO DE PRODUCCIÓN:")
         print("-" * 40)
-        total_entrada = self.datos_flujo['A_to_H']
-        total_salida = self.datos_flujo['E_to_V']
-        total_reproceso = self.datos_flujo['H_to_R'] + self.datos_flujo['E_to_R']
-        total_descarte = self.datos_flujo['R_to_D']
+        total_entrada, total_salida, h_to_r, e_to_r, total_descarte = _leer_totales(self.datos_flujo)
+        total_reproceso = h_to_r + e_to_r
         
         print(f"Productos iniciales:     {total_entrada:,}")
         print(f"Productos vendidos:      {total_salida:,}")
@@ -127,33 +345,14 @@ class DetectorCuelloBotellaCorregido:
         print("CONSTRUCCIÓN DE MATRIZ DE TRANSICIÓN")
         print("="*60)
         
-        # Inicializar matriz 6x6 con ceros
-        self.matriz_transicion = np.zeros((6, 6), dtype=float)
-        
-        # Flujo de Amasado (A) → Horneado (H) - 100%
-        self.matriz_transicion[0, 1] = 1.0
+        # Los mismos flujos reutilizan la matriz y su descomposición ya calculadas
+        self._clave_flujos = tuple(sorted(self.datos_flujo.items()))
+        self.matriz_transicion = _matriz_transicion(self._clave_flujos)
         
-        # Flujo de Horneado (H)
-        total_h = self.datos_flujo['H_to_E'] + self.datos_flujo['H_to_R']
-        if total_h > 0:
-            self.matriz_transicion[1, 2] = self.datos_flujo['H_to_E'] / total_h  # A empaque
-            self.matriz_transicion[1, 3] = self.datos_flujo['H_to_R'] / total_h  # A reproceso
-        
-        # Flujo de Empaque (E)
-        total_e = self.datos_flujo['E_to_V'] + self.datos_flujo['E_to_R']
-        if total_e > 0:
-            self.matriz_transicion[2, 4] = self.datos_flujo['E_to_V'] / total_e  # A venta
-            self.matriz_transicion[2, 3] = self.datos_flujo['E_to_R'] / total_e  # A reproceso
-        
-        # Flujo de Reproceso (R)
-        total_r = self.datos_flujo['R_to_H'] + self.datos_flujo['R_to_D']
-        if total_r > 0:
-            self.matriz_transicion[3, 1] = self.datos_flujo['R_to_H'] / total_r  # A horneado
-            self.matriz_transicion[3, 5] = self.datos_flujo['R_to_D'] / total_r  # A descarte
-        
-        # Estados absorbentes (según el informe)
-        self.matriz_transicion[4, 4] = 1.0  # Venta se queda en venta
-        self.matriz_transicion[5, 5] = 1.0  # Descarte se queda en descarte
+        # Una matriz nueva invalida los resultados espectrales anteriores
+        self.autovalores = None
+        self.autovalor_dominante = None
+        self.autovector_dominante = None
         
         self._mostrar_matriz()
     
@@ -162,68 +361,72 @@ class DetectorCuelloBotellaCorregido:
         print("\n📐 MATRIZ DE TRANSICIÓN (6×6):")
         print("-" * 50)
         
-        # Encabezado
-        print("      ", end="")
-        for etapa in self.etapas_abrev:
-            print(f"{etapa:8}", end="")
-        print()
-        
-        # Filas de la matriz
-        for i, fila in enumerate(self.matriz_transicion):
-            print(f"{self.etapas_abrev[i]:4}", end="")
-            for valor in fila:
-                print(f"{valor:8.3f}", end="")
-            print(f"  {self.etapas[i]}")
+        # Encabezado y filas se arman como columnas de texto y se escriben
+        # con un solo print en lugar de uno por celda
+        encabezado = "      " + "".join(f"{etapa:8}" for etapa in self.ETAPAS_ABREV)
+        valores = ["".join(fila) for fila in np.char.mod("%8.3f", self.matriz_transicion)]
+        filas = np.char.add(np.char.add(np.char.ljust(self.ETAPAS_ABREV, 4), valores),
+                            np.char.add("  ", self.ETAPAS))
+        print("\n".join([encabezado, *filas]))
         
         # Verificar que es estocástica
         sumas_filas = np.sum(self.matriz_transicion, axis=1)
         print(f"\n✓ Verificación (suma de filas = 1.0): {np.allclose(sumas_filas, 1.0)}")
     
+    def calcular_autovalor_dominante(self):
+        """
+        Calcula solo los autovalores (camino rápido para el análisis de estabilidad)
+        """
+        self.autovalores = _autovalores(_clave_matriz(self.matriz_transicion))
+        
+        # Identificar el autovalor dominante (el de mayor magnitud)
+        self.autovalor_dominante = self.autovalores[0]
+    
     def calcular_autovalores_scipy(self):
         """
-        Calcula autovalores y autovectores usando SciPy (según el informe)
+        Calcula autovalores y autovectores usando NumPy (según el informe)
         """
         print("\n" + "="*60)
         print("CÁLCULO DE AUTOVALORES Y AUTOVECTORES")
-        print("Usando SciPy (según metodología del informe)")
+        print("Usando NumPy (según metodología del informe)")
         print("="*60)
         
-        # Calcular autovalores y autovectores usando SciPy
-        self.autovalores, self.autovectores = linalg.eig(self.matriz_transicion)
-        
-        # Convertir a reales (eliminando parte imaginaria despreciable)
-        self.autovalores = np.real(self.autovalores)
-        self.autovectores = np.real(self.autovectores)
-        
-        # Ordenar por magnitud (mayor a menor) - importante para encontrar el dominante
-        idx = np.argsort(np.abs(self.autovalores))[::-1]
-        self.autovalores = self.autovalores[idx]
-        self.autovectores = self.autovectores[:, idx]
+        # Reutilizar los autovalores si el análisis de estabilidad ya los calculó
+        if self.autovalores is None:
+            self.calcular_autovalor_dominante()
         
         print("\\n📈 AUTOVALORES ENCONTRADOS:")
         print("-" * 40)
         for i, av in enumerate(self.autovalores):
             print(f"   λ{i+1} = {av:.6f}")
         
-        # Identificar el autovalor dominante (el de mayor magnitud)
-        self.autovalor_dominante = self.autovalores[0]
-        self.autovector_dominante = self.autovectores[:, 0]
-        
-        # Normalizar el autovector dominante para que sume 1
-        # Esto es crucial para la interpretación correcta
-        self.autovector_dominante = np.abs(self.autovector_dominante)
-        self.autovector_dominante = self.autovector_dominante / self.autovector_dominante.sum()
+        # La cadena armada desde datos_flujo tiene topología fija y su autovector
+        # tiene forma cerrada; una matriz asignada o modificada a mano no
+        self.autovector_dominante = None
+        if self.forma_cerrada and self._matriz_es_de_flujos():
+            self.autovector_dominante = _autovector_forma_cerrada(self._clave_flujos)
+        if self.autovector_dominante is None:
+            self.autovector_dominante = _autovector_dominante(_clave_matriz(self.matriz_transicion))
         
         print(f"\\n✓ Autovalor dominante: λ_max = {self.autovalor_dominante:.6f}")
         print(f"✓ Autovector dominante normalizado:")
         for i, valor in enumerate(self.autovector_dominante):
-            print(f"   {self.etapas[i]:12}: {valor:.6f}")
+            print(f"   {self.ETAPAS[i]:12}: {valor:.6f}")
+    
+    def _matriz_es_de_flujos(self):
+        """Indica si matriz_transicion es la construida desde los datos de flujo"""
+        return (self._clave_flujos is not None
+                and self.matriz_transicion is _matriz_transicion(self._clave_flujos))
     
     def identificar_cuello_botella(self):
         """
         Identifica el cuello de botella basado en el autovector dominante
         **CORREGIDO**: Solo considera etapas productivas, no estados absorbentes
         """
+        # El autovector dominante se calcula solo cuando se necesita
+        if self.autovector_dominante is None:
+            self.calcular_autovalores_scipy()
+        
         print("\\n" + "="*60)
         print("IDENTIFICACIÓN DEL CUELLO DE BOTELLA")
         print("Basado en el autovector dominante")
@@ -235,22 +438,20 @@ class DetectorCuelloBotellaCorregido:
         # NO consideramos Venta y Descarte porque son estados absorbentes
         # El cuello de botella está en el proceso, no en los resultados finales
         
-        etapas_productivas = self.etapas[:4]  # Primeras 4 etapas
-        valores_productivos = self.autovector_dominante[:4]  # Sus valores en el autovector
-        
-        # Encontrar el valor máximo entre las etapas productivas
+        # Encontrar el valor máximo entre las etapas productivas (la máscara
+        # descarta los estados absorbentes sin copiar el autovector)
         # Este es el cuello de botella según la metodología
-        max_idx_productivo = np.argmax(valores_productivos)
-        self.cuello_botella_idx = max_idx_productivo  # Índice en las etapas productivas
-        self.cuello_botella_nombre = etapas_productivas[max_idx_productivo]
+        self.cuello_botella_idx = int(np.argmax(np.where(self._MASCARA_PRODUCTIVA,
+                                                         self.autovector_dominante, -np.inf)))
+        self.cuello_botella_nombre = self.ETAPAS[self.cuello_botella_idx]
         
         print("📊 DISTRIBUCIÓN ESTACIONARIA DEL FLUJO:")
         print("(Basada en el autovector dominante normalizado)")
         print("-" * 50)
         
-        for i, (etapa, valor) in enumerate(zip(self.etapas, self.autovector_dominante)):
+        for i, (etapa, valor) in enumerate(zip(self.ETAPAS, self.autovector_dominante)):
             porcentaje = valor * 100
-            barra = "█" * int(porcentaje * 2)
+            barra = self._BARRAS[max(0, min(int(porcentaje * 2), 200))]
             
             if i < 4 and i == self.cuello_botella_idx:  # Solo marcar si es etapa productiva
                 print(f"🔴 {etapa:12}: {porcentaje:6.2f}% {barra} ← CUELLO DE BOTELLA")
@@ -260,7 +461,7 @@ class DetectorCuelloBotellaCorregido:
                 print(f"📤 {etapa:12}: {porcentaje:6.2f}% {barra} ← Estado absorbente")
         
         print(f"\\n🎯 Cuello de botella identificado: {self.cuello_botella_nombre}")
-        print(f"   Este proceso concentra {(valores_productivos[max_idx_productivo] * 100):.2f}% del flujo en equilibrio")
+        print(f"   Este proceso concentra {(self.autovector_dominante[self.cuello_botella_idx] * 100):.2f}% del flujo en equilibrio")
         print(f"   Requiere optimización prioritaria")
         print(f"   (Los estados absorbentes Venta y Descarte NO pueden ser cuellos de botella)")
     
@@ -272,6 +473,10 @@ class DetectorCuelloBotellaCorregido:
         print("ANÁLISIS DE ESTABILIDAD DEL SISTEMA")
         print("="*60)
         
+        # La estabilidad solo depende del autovalor dominante
+        if self.autovalor_dominante is None:
+            self.calcular_autovalor_dominante()
+        
         if abs(self.autovalor_dominante - 1.0) < 0.001:
             print("✅ SISTEMA ESTABLE")
             print("   El flujo de producción se mantiene sin pérdidas significativas")
@@ -290,6 +495,65 @@ class DetectorCuelloBotellaCorregido:
         
         return estabilidad
     
+    def convergencia(self, k=64, distribucion_inicial=None):
+        """
+        Devuelve la distribución del flujo después de k ciclos, p0·P^k.
+        Por defecto todo el producto parte de Amasado. P^k se calcula por
+        cuadrados sucesivos (log2(k) productos de matrices) en vez de k pasos.
+        """
+        if distribucion_inicial is None:
+            distribucion_inicial = np.zeros(len(self.ETAPAS))
+            distribucion_inicial[0] = 1.0
+        return distribucion_inicial @ np.linalg.matrix_power(self.matriz_transicion, k)
+    
+    def analizar_batch(self, lista_flujos):
+        """
+        Analiza varios escenarios de flujo (p. ej. un barrido "qué pasa si")
+        con una sola llamada a LAPACK por paso, sin imprimir ni modificar el
+        estado del detector. Devuelve un diccionario de resultados por escenario.
+        """
+        if not lista_flujos:
+            return []
+        
+        # Los escenarios parciales se completan igual que en ingresar_datos_flujo_dict
+        lista_flujos = [self._completar_flujos(f) for f in lista_flujos]
+        flujos = np.array([_leer_flujos(f) for f in lista_flujos], dtype=float)
+        matrices = _matrices_transicion(flujos)
+        
+        # Autovalor dominante de cada escenario (el de mayor magnitud)
+        autovalores = np.linalg.eigvals(matrices)
+        dominantes = np.real(autovalores[np.arange(len(matrices)),
+                                         np.argmax(np.abs(autovalores), axis=1)])
+        
+        # Autovectores dominantes normalizados para que sumen 1
+        try:
+            autovectores = _resolver_autovectores(matrices)
+        except np.linalg.LinAlgError:
+            # Un ciclo sin salida (p. ej. H ↔ R sin descarte) deja singular el
+            # sistema de ese escenario: se resuelve cada uno por separado y los
+            # singulares usan el mismo cálculo que el análisis individual
+            autovectores = np.empty((len(matrices), len(self.ETAPAS)))
+            for i in range(len(matrices)):
+                try:
+                    autovectores[i] = _resolver_autovectores(matrices[i:i + 1])[0]
+                except np.linalg.LinAlgError:
+                    autovectores[i] = _autovector_dominante(_clave_matriz(matrices[i]))
+        autovectores /= autovectores.sum(axis=1, keepdims=True)
+        
+        # Cuello de botella: solo etapas productivas
+        cuellos = np.argmax(np.where(self._MASCARA_PRODUCTIVA, autovectores, -np.inf), axis=1)
+        
+        return [
+            {
+                'datos_flujo': f,
+                'autovalor_dominante': float(dominante),
+                'distribucion_flujo': dict(zip(self.ETAPAS, autovector.tolist())),
+                'cuello_botella': self.ETAPAS[cuello]
+            }
+            for f, dominante, autovector, cuello in zip(lista_flujos, dominantes,
+                                                      autovectores, cuellos)
+        ]
+    
     def generar_recomendaciones(self):
         """
         Genera recomendaciones específicas basadas en el análisis
@@ -307,8 +571,7 @@ class DetectorCuelloBotellaCorregido:
         recomendaciones.append(f"   - Capacitar al personal específicamente para {self.cuello_botella_nombre}")
         
         # Análisis de eficiencia general
-        total_inicial = self.datos_flujo['A_to_H']
-        total_final = self.datos_flujo['E_to_V']
+        total_inicial, total_final, h_to_r, e_to_r, _ = _leer_totales(self.datos_flujo)
         eficiencia = (total_final / total_inicial) * 100
         
         if eficiencia < 90:
@@ -316,7 +579,7 @@ class DetectorCuelloBotellaCorregido:
             recomendaciones.append("   - Revisar todos los procesos para identificar pérdidas")
         
         # Análisis de reproceso
-        total_reproceso = self.datos_flujo['H_to_R'] + self.datos_flujo['E_to_R']
+        total_reproceso = h_to_r + e_to_r
         tasa_reproceso = (total_reproceso / total_inicial) * 100
         
         if tasa_reproceso > 5:
@@ -341,15 +604,31 @@ class DetectorCuelloBotellaCorregido:
         print("GENERANDO VISUALIZACIONES")
         print("="*60)
         
-        # Crear figura con subplots
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 12))
+        # Matplotlib y seaborn se importan aquí: su carga es lenta y el resto
+        # del análisis (incluido el reporte JSON) no los necesita
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        
+        # Configuración de estilo para gráficos
+        plt.style.use('seaborn-v0_8')
+        sns.set_palette("husl")
+        
+        # Crear figura con subplots. Se reutiliza la misma figura entre corridas
+        # (p. ej. en un barrido) para no acumular figuras abiertas; si la ventana
+        # se cerró (o es la primera vez) se crea otra
+        if self._figura is None or not plt.fignum_exists(self._figura.number):
+            self._figura = plt.figure(figsize=(15, 12))
+        else:
+            self._figura.clf()
+        fig = self._figura
+        (ax1, ax2), (ax3, ax4) = fig.subplots(2, 2)
         fig.suptitle('Análisis de Cuello de Botella - Panadería Artesanal\\n(Usando Autovalores y Autovectores - Metodología del Informe)', 
                      fontsize=16, fontweight='bold')
         
         # 1. Distribución del flujo basada en el autovector dominante
         # **CORREGIDO**: Solo destacar el cuello de botella en etapas productivas
         colores = []
-        for i in range(len(self.etapas)):
+        for i in range(len(self.ETAPAS)):
             if i < 4 and i == self.cuello_botella_idx:  # Si es etapa productiva y es el cuello de botella
                 colores.append('red')
             elif i < 4:  # Etapa productiva normal
@@ -357,7 +636,7 @@ class DetectorCuelloBotellaCorregido:
             else:  # Estados absorbentes
                 colores.append('lightgray')
         
-        barras = ax1.bar(self.etapas, self.autovector_dominante * 100, color=colores)
+        barras = ax1.bar(self.ETAPAS, self.autovector_dominante * 100, color=colores)
         ax1.set_title('Distribución Estacionaria del Flujo\\n(Autovector Dominante)')
         ax1.set_ylabel('Porcentaje del Flujo (%)')
         ax1.tick_params(axis='x', rotation=45)
@@ -382,20 +661,20 @@ class DetectorCuelloBotellaCorregido:
         # 2. Matriz de transición como heatmap
         im = ax2.imshow(self.matriz_transicion, cmap='Blues', aspect='auto')
         ax2.set_title('Matriz de Transición Estocástica')
-        ax2.set_xticks(range(len(self.etapas_abrev)))
-        ax2.set_yticks(range(len(self.etapas_abrev)))
-        ax2.set_xticklabels(self.etapas_abrev)
-        ax2.set_yticklabels(self.etapas_abrev)
+        ax2.set_xticks(range(len(self.ETAPAS_ABREV)))
+        ax2.set_yticks(range(len(self.ETAPAS_ABREV)))
+        ax2.set_xticklabels(self.ETAPAS_ABREV)
+        ax2.set_yticklabels(self.ETAPAS_ABREV)
         
         # Añadir valores a la matriz
-        for i in range(len(self.etapas)):
-            for j in range(len(self.etapas)):
+        for i in range(len(self.ETAPAS)):
+            for j in range(len(self.ETAPAS)):
                 valor = self.matriz_transicion[i, j]
                 if valor > 0.001:
                     ax2.text(j, i, f'{valor:.3f}', 
                             ha='center', va='center', fontsize=8, fontweight='bold')
         
-        plt.colorbar(im, ax=ax2, label='Probabilidad')
+        fig.colorbar(im, ax=ax2, label='Probabilidad')
         
         # 3. Flujo de producción (cantidades reales)
         flujo_data = {
@@ -453,15 +732,22 @@ class DetectorCuelloBotellaCorregido:
             ax4.text(barra.get_x() + barra.get_width()/2, ef + 2, f'{ef:.1f}%', 
                     ha='center', va='bottom', fontweight='bold')
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         # Guardar gráfico
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f'analisis_cuello_botella_CORREGIDO_{timestamp}.png'
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
+        if MODO_BATCH:
+            # Sin bbox_inches='tight' se evita un segundo renderizado, y a 150 dpi
+            # se rasteriza la cuarta parte de los píxeles
+            fig.savefig(filename, dpi=150)
+        else:
+            fig.savefig(filename, dpi=300, bbox_inches='tight')
         print(f"✓ Gráfico guardado como: {filename}")
         
-        plt.show()
+        # plt.show() bloquea hasta cerrar la ventana: no se usa en lote
+        if not MODO_BATCH:
+            plt.show()
         
         return fig
     
@@ -484,7 +770,7 @@ class DetectorCuelloBotellaCorregido:
             'autovalor_dominante': float(self.autovalor_dominante),
             'distribucion_flujo': {
                 etapa: float(porcentaje) 
-                for etapa, porcentaje in zip(self.etapas, self.autovector_dominante)
+                for etapa, porcentaje in zip(self.ETAPAS, self.autovector_dominante)
             },
             'eficiencia_general': float((self.datos_flujo['E_to_V'] / self.datos_flujo['A_to_H']) * 100),
             'tasa_reproceso': float(((self.datos_flujo['H_to_R'] + self.datos_flujo['E_to_R']) / self.datos_flujo['A_to_H']) * 100),
@@ -501,8 +787,15 @@ class DetectorCuelloBotellaCorregido:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f'reporte_cuello_botella_CORREGIDO_{timestamp}.json'
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        # orjson serializa directamente a bytes UTF-8 (OPT_SERIALIZE_NUMPY cubre
+        # cualquier arreglo de NumPy que llegue al reporte)
+        if orjson is not None:
+            contenido = orjson.dumps(reporte, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        else:
+            contenido = json.dumps(reporte, indent=2, ensure_ascii=False).encode('utf-8')
+        
+        with open(filename, 'wb') as f:
+            f.write(contenido)
         
         print(f"✓ Reporte guardado como: {filename}")
         
@@ -540,7 +833,6 @@ def main():
         # Ejecutar análisis completo según la metodología del informe
         detector.ingresar_datos_flujo()
         detector.construir_matriz_transicion()
-        detector.calcular_autovalores_scipy()
         detector.analizar_estabilidad_sistema()
         detector.identificar_cuello_botella()
         detector.generar_recomendaciones()